@@ -7,115 +7,160 @@ This script reads execution logs and creates two heatmaps:
 2. Improvement percentage of catapulted over notcatapulted
 
 Usage:
-    python plot_heatmaps.py <metric_key> [--output output.png]
+    python plot_heatmaps.py <metric_key> [<metric_key> ...] [--output output.png]
 
 Example:
     python plot_heatmaps.py qps
     python plot_heatmaps.py elapsed_secs --output elapsed_comparison.png
+    python plot_heatmaps.py qps elapsed_secs avg_dists_computed
 """
 
 import argparse
+import io
 import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
+import pandas as pd
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def load_json_file(filepath: Path) -> Dict:
-    """Load and parse a JSON file."""
+    """Load and parse a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(Path(filepath).read_bytes())
+
     with open(filepath, "r") as f:
         data = json.load(f)
     return data
 
 
+def _result_tuples(
+    results: Iterable[Dict], metric_key: str
+) -> Iterator[Tuple[int, int, int, Optional[float]]]:
+    """Project result dictionaries onto the fields used for plotting."""
+    for result in results:
+        yield (
+            result["num_threads"],
+            result["beam_width"],
+            result["seed"],
+            result.get(metric_key),
+        )
+
+
+def iter_results(
+    filepath: Path, metric_key: str
+) -> Iterator[Tuple[int, int, int, Optional[float]]]:
+    """
+    Stream (num_threads, beam_width, seed, metric_value) tuples from a log file.
+
+    When ijson is installed the results array is parsed one entry at a time,
+    so only the fields needed for the metric are ever kept in memory.
+    Otherwise the whole file is loaded with load_json_file.
+
+    Args:
+        filepath: Path to the JSON execution log
+        metric_key: The metric to extract (e.g., 'qps', 'elapsed_secs')
+
+    Yields:
+        Tuples of (num_threads, beam_width, seed, metric_value), where
+        metric_value is None if the metric is missing or null
+    """
+    if ijson is None:
+        results = load_json_file(filepath).get("results", [])
+        yield from _result_tuples(results, metric_key)
+        return
+
+    with open(filepath, "rb") as f:
+        results = ijson.items(f, "results.item", use_float=True)
+        yield from _result_tuples(results, metric_key)
+
+
 def extract_data(
-    results: List[Dict], metric_key: str
-) -> Dict[Tuple[int, int, int], float]:
+    results: Iterable[Tuple[int, int, int, Optional[float]]], metric_key: str
+) -> pd.DataFrame:
     """
     Extract metric values indexed by (num_threads, beam_width, seed).
 
     Args:
-        results: List of result dictionaries
+        results: (num_threads, beam_width, seed, metric_value) tuples, as
+            yielded by iter_results
         metric_key: The metric to extract (e.g., 'qps', 'elapsed_secs')
 
     Returns:
-        Dictionary mapping (num_threads, beam_width, seed) -> metric_value
+        DataFrame with num_threads, beam_width, seed and metric_key columns;
+        missing or null metric values are NaN
     """
-    data = {}
-    for result in results:
-        key = (result["num_threads"], result["beam_width"], result["seed"])
-        if metric_key not in result:
-            print(f"Warning: metric '{metric_key}' not found in result: {result}")
-            continue
-        data[key] = result[metric_key]
+    columns = ["num_threads", "beam_width", "seed", metric_key]
+    data = pd.DataFrame(results, columns=columns)
+    data[metric_key] = pd.to_numeric(data[metric_key])
     return data
 
 
-def average_across_seeds(
-    data: Dict[Tuple[int, int, int], float],
-) -> Dict[Tuple[int, int], float]:
+def average_across_seeds(data: pd.DataFrame, metric_key: str) -> pd.DataFrame:
     """
     Average metric values across different seeds.
 
     Args:
-        data: Dictionary mapping (num_threads, beam_width, seed) -> metric_value
+        data: DataFrame as returned by extract_data
+        metric_key: The metric to average
 
     Returns:
-        Dictionary mapping (num_threads, beam_width) -> averaged_value
+        DataFrame with sorted num_threads rows and beam_width columns holding
+        the averaged values; missing combinations are NaN
     """
-    # Group by (num_threads, beam_width)
-    grouped = {}
-    for (num_threads, beam_width, seed), value in data.items():
-        key = (num_threads, beam_width)
-        if key not in grouped:
-            grouped[key] = []
-        grouped[key].append(value)
-
-    # Average across seeds
-    averaged = {}
-    for key, values in grouped.items():
-        averaged[key] = np.mean(values)
-
-    return averaged
+    # Groups by (num_threads, beam_width) and lays the result out as a matrix
+    # in a single call; null metric values are skipped by the mean
+    return data.pivot_table(
+        index="num_threads",
+        columns="beam_width",
+        values=metric_key,
+        aggfunc="mean",
+        observed=True,
+    )
 
 
 def create_heatmap_matrix(
-    data: Dict[Tuple[int, int], float],
+    data: pd.DataFrame,
 ) -> Tuple[np.ndarray, List[int], List[int]]:
     """
     Create a 2D matrix for heatmap plotting.
 
     Args:
-        data: Dictionary mapping (num_threads, beam_width) -> value
+        data: DataFrame with num_threads rows and beam_width columns
 
     Returns:
         Tuple of (matrix, num_threads_labels, beam_width_labels)
     """
-    # Get unique sorted values for each dimension
-    num_threads_set = sorted(set(key[0] for key in data.keys()))
-    beam_width_set = sorted(set(key[1] for key in data.keys()))
+    return data.to_numpy(dtype=float), data.index.tolist(), data.columns.tolist()
 
-    # Create matrix - flipped so num_threads is on y-axis
-    matrix = np.full((len(num_threads_set), len(beam_width_set)), np.nan)
 
-    # Fill matrix - swapped indices so num_threads is rows (y-axis)
-    for (num_threads, beam_width), value in data.items():
-        i = num_threads_set.index(num_threads)
-        j = beam_width_set.index(beam_width)
-        matrix[i, j] = value
-
-    return matrix, num_threads_set, beam_width_set
+def _cells(mask: pd.DataFrame) -> pd.Index:
+    """Return the (num_threads, beam_width) keys of the True cells of mask."""
+    stacked = mask.stack()
+    return stacked.index[stacked.to_numpy(dtype=bool)]
 
 
 def calculate_improvement_pct(
-    catapulted_data: Dict[Tuple[int, int], float],
-    notcatapulted_data: Dict[Tuple[int, int], float],
+    catapulted_data: pd.DataFrame,
+    notcatapulted_data: pd.DataFrame,
     metric_key: str,
-) -> Dict[Tuple[int, int], float]:
+) -> pd.DataFrame:
     """
     Calculate percentage improvement of catapulted over notcatapulted.
 
@@ -131,32 +176,44 @@ def calculate_improvement_pct(
         metric_key: The metric being compared
 
     Returns:
-        Dictionary mapping (num_threads, beam_width) -> improvement_percentage
+        DataFrame shaped like catapulted_data holding the improvement
+        percentages; cells that cannot be compared are NaN
     """
     # Metrics where lower values are better
     lower_is_better = {"elapsed_secs", "avg_dists_computed", "avg_nodes_visited"}
 
-    improvement = {}
-    for key in catapulted_data.keys():
-        if key not in notcatapulted_data:
-            print(f"Warning: key {key} not found in notcatapulted data")
-            continue
+    sign = -1 if metric_key in lower_is_better else 1
+
+    # Align notcatapulted values with the catapulted matrix; cells that have
+    # no counterpart, or whose notcatapulted value is 0, end up as NaN
+    notcat = notcatapulted_data.reindex_like(catapulted_data)
+    present = catapulted_data.notna()
+    for key in _cells(present & notcat.isna()):
+        print(f"Warning: key {key} not found in notcatapulted data")
+    for key in _cells(present & (notcat == 0)):
+        print(f"Warning: notcatapulted value is 0 for key {key}, skipping")
+    notcat = notcat.where(notcat != 0)
 
-        cat_val = catapulted_data[key]
-        notcat_val = notcatapulted_data[key]
+    return sign * (catapulted_data - notcat) / notcat * 100
 
-        if notcat_val == 0:
-            print(f"Warning: notcatapulted value is 0 for key {key}, skipping")
-            continue
 
-        if metric_key in lower_is_better:
-            # For metrics where lower is better
-            improvement[key] = ((notcat_val - cat_val) / notcat_val) * 100
-        else:
-            # For metrics where higher is better
-            improvement[key] = ((cat_val - notcat_val) / notcat_val) * 100
+@lru_cache(maxsize=None)
+def _get_plt():
+    """
+    Import pyplot and seaborn on first use.
+
+    Importing them pulls in font caching and backend discovery, which callers
+    that only parse logs should not pay for.
+    """
+    # Render off-screen; skips GUI backend discovery on headless machines
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-    return improvement
+    # Lay out figures with the constrained layout engine instead of
+    # per-figure tight_layout passes
+    plt.rcParams["figure.constrained_layout.use"] = True
+    return plt, sns
 
 
 def plot_heatmaps(
@@ -166,6 +223,7 @@ def plot_heatmaps(
     beam_width_labels: List[int],
     metric_key: str,
     output_path: Path = None,
+    dpi: int = 150,
 ):
     """
     Plot two heatmaps side by side.
@@ -176,8 +234,12 @@ def plot_heatmaps(
         num_threads_labels: Labels for x-axis
         beam_width_labels: Labels for y-axis
         metric_key: The metric being plotted
-        output_path: Path to save the figure (optional)
+        output_path: Path to save the figure (optional); the image format
+            follows its extension, e.g. .webp for much smaller files
+        dpi: Resolution of the saved image
     """
+    plt, sns = _get_plt()
+
     # Determine number of subplots based on whether we have comparison data
     num_plots = 1 if improvement_matrix is None else 2
     fig, axes = plt.subplots(1, num_plots, figsize=(8 * num_plots, 6))
@@ -203,23 +265,16 @@ def plot_heatmaps(
 
     # Second heatmap: Improvement percentage (only if comparison data exists)
     if improvement_matrix is not None:
-        # Create custom annotations with +/- and % formatting
-        annot_matrix = np.empty_like(improvement_matrix, dtype=object)
-        for i in range(improvement_matrix.shape[0]):
-            for j in range(improvement_matrix.shape[1]):
-                val = improvement_matrix[i, j]
-                if np.isnan(val):
-                    annot_matrix[i, j] = ""
-                elif val >= 0:
-                    annot_matrix[i, j] = f"+{val:.2f}%"
-                else:
-                    annot_matrix[i, j] = f"{val:.2f}%"
+        # Cells without a comparison are masked out, which also skips
+        # their annotations
+        nan_mask = np.isnan(improvement_matrix)
 
         # Use a diverging colormap centered at 0
-        vmax = np.nanmax(np.abs(improvement_matrix))
+        vmax = np.abs(np.where(nan_mask, 0.0, improvement_matrix)).max(initial=0.0)
         sns.heatmap(
             improvement_matrix,
-            annot=annot_matrix,
+            mask=nan_mask,
+            annot=np.char.mod("%+.2f%%", improvement_matrix),
             fmt="",
             cmap="RdYlGn",
             center=0,
@@ -238,18 +293,142 @@ def plot_heatmaps(
         axes[1].set_xlabel("beam_width", fontsize=12)
         axes[1].set_ylabel("num_threads", fontsize=12)
 
-    plt.tight_layout()
+    if output_path is None:
+        output_path = Path(f"{metric_key}_heatmaps.png")
 
-    if output_path:
-        plt.savefig(output_path, dpi=300, bbox_inches="tight")
-        print(f"Saved plot to {output_path}")
-    else:
-        plt.savefig(f"{metric_key}_heatmaps.png", dpi=300, bbox_inches="tight")
-        print(f"Saved plot to {metric_key}_heatmaps.png")
+    # The constrained layout already fits the figure, so no bbox_inches="tight"
+    # pass is needed. A fixed Software tag (instead of the matplotlib version
+    # string) means regenerated pngs only differ when their pixels do.
+    metadata = None
+    if output_path.suffix.lower() == ".png":
+        metadata = {"Software": "plot_heatmaps"}
+    plt.savefig(output_path, dpi=dpi, metadata=metadata)
+    print(f"Saved plot to {output_path}")
 
     plt.close()
 
 
+def plot_metric(
+    metric_key: str,
+    catapulted_path: Path,
+    notcatapulted_path: Path,
+    output_path: Path = None,
+    dpi: int = 150,
+):
+    """
+    Load, aggregate and plot a single metric.
+
+    Args:
+        metric_key: The metric to plot
+        catapulted_path: Path to catapulted.json
+        notcatapulted_path: Path to notcatapulted.json (may not exist)
+        output_path: Path to save the figure (optional)
+        dpi: Resolution of the saved image
+    """
+    # Load catapulted data
+    catapulted_data = extract_data(
+        iter_results(catapulted_path, metric_key), metric_key
+    )
+
+    if catapulted_data.empty:
+        print("Error: No results found in catapulted.json", file=sys.stderr)
+        sys.exit(1)
+
+    missing = catapulted_data[metric_key].isna().sum()
+    if missing == len(catapulted_data):
+        print(
+            f"Error: Metric '{metric_key}' is null in all catapulted results",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    if missing:
+        print(
+            f"Warning: metric '{metric_key}' not found in {missing} catapulted results"
+        )
+
+    # Load notcatapulted data if available
+    notcatapulted_data = None
+    has_comparison_data = False
+    if notcatapulted_path.exists():
+        notcatapulted_data = extract_data(
+            iter_results(notcatapulted_path, metric_key), metric_key
+        )
+        # Compare only if the metric is not null in some notcatapulted result
+        has_comparison_data = bool(notcatapulted_data[metric_key].notna().any())
+        if notcatapulted_data.empty:
+            print(
+                "Warning: No results found in notcatapulted.json, skipping comparison plot"
+            )
+        elif not has_comparison_data:
+            print(
+                f"Warning: Metric '{metric_key}' is null in all notcatapulted results, skipping comparison plot"
+            )
+    else:
+        print(f"Warning: {notcatapulted_path} does not exist, skipping comparison plot")
+
+    print(f"Processing metric: {metric_key}")
+    print(f"Catapulted results: {len(catapulted_data)}")
+    if has_comparison_data:
+        print(f"NotCatapulted results: {len(notcatapulted_data)}")
+
+    # Average across seeds
+    print("Averaging across seeds...")
+    catapulted_avg = average_across_seeds(catapulted_data, metric_key)
+
+    # Calculate improvement only if we have comparison data
+    improvement_matrix = None
+    if has_comparison_data:
+        notcatapulted_avg = average_across_seeds(notcatapulted_data, metric_key)
+
+        print("Calculating improvement percentages...")
+        improvement = calculate_improvement_pct(
+            catapulted_avg, notcatapulted_avg, metric_key
+        )
+        improvement_matrix, _, _ = create_heatmap_matrix(improvement)
+
+    # Create matrices for heatmaps
+    print("Creating heatmap matrices...")
+    catapulted_matrix, num_threads_labels, beam_width_labels = create_heatmap_matrix(
+        catapulted_avg
+    )
+
+    # Plot heatmaps
+    print("Generating plots...")
+    plot_heatmaps(
+        catapulted_matrix,
+        improvement_matrix,
+        num_threads_labels,
+        beam_width_labels,
+        metric_key,
+        output_path,
+        dpi,
+    )
+
+    print("Done!")
+
+
+def plot_metric_buffered(metric_key: str, **kwargs):
+    """
+    Run plot_metric with its output prefixed by the metric key.
+
+    Workers of a batch run share stdout and stderr, so each metric's lines
+    are held back and printed together once it is done (or has failed).
+
+    Args:
+        metric_key: The metric to plot
+        **kwargs: Forwarded to plot_metric
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            plot_metric(metric_key, **kwargs)
+    finally:
+        for buffer, stream in ((stdout, sys.stdout), (stderr, sys.stderr)):
+            lines = buffer.getvalue().splitlines(keepends=True)
+            stream.write("".join(f"[{metric_key}] {line}" for line in lines))
+            stream.flush()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Plot heatmaps comparing catapulted vs non-catapulted execution metrics.",
@@ -259,6 +438,8 @@ Examples:
   %(prog)s qps
   %(prog)s elapsed_secs --output elapsed_comparison.png
   %(prog)s avg_dists_computed
+  %(prog)s qps --output qps_heatmaps.webp --dpi 100
+  %(prog)s qps elapsed_secs avg_dists_computed --jobs 3
 
 Available metrics:
   - qps: Queries per second
@@ -270,16 +451,31 @@ Available metrics:
         """,
     )
     parser.add_argument(
-        "metric_key",
+        "metric_keys",
+        metavar="metric_key",
         type=str,
-        help="The metric to plot (e.g., qps, elapsed_secs, avg_dists_computed)",
+        nargs="+",
+        help="The metric(s) to plot (e.g., qps, elapsed_secs, avg_dists_computed)",
     )
     parser.add_argument(
         "--output",
         "-o",
         type=str,
         default=None,
-        help="Output filename for the plot (default: <metric_key>_heatmaps.png)",
+        help="Output filename for the plot; the extension picks the format (default: <metric_key>_heatmaps.png)",
+    )
+    parser.add_argument(
+        "--dpi",
+        type=int,
+        default=150,
+        help="Resolution of the saved plot (default: 150)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=4,
+        help="Number of metrics plotted in parallel; each metric loads the json files on its own (default: 4)",
     )
     parser.add_argument(
         "--catapulted",
@@ -295,6 +491,10 @@ Available metrics:
     )
 
     args = parser.parse_args()
+    if args.output and len(args.metric_keys) > 1:
+        parser.error("--output can only be used with a single metric")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     # Convert paths to Path objects
     catapulted_path = Path(args.catapulted)
@@ -306,81 +506,20 @@ Available metrics:
         print(f"Error: {catapulted_path} does not exist", file=sys.stderr)
         sys.exit(1)
 
-    # Load catapulted data
-    catapulted_json = load_json_file(catapulted_path)
-    catapulted_results = catapulted_json.get("results", [])
-
-    if not catapulted_results:
-        print("Error: No results found in catapulted.json", file=sys.stderr)
-        sys.exit(1)
-
-    # Load notcatapulted data if available
-    notcatapulted_results = []
-    has_comparison_data = False
-    if notcatapulted_path.exists():
-        notcatapulted_json = load_json_file(notcatapulted_path)
-        notcatapulted_results = notcatapulted_json.get("results", [])
-        if notcatapulted_results:
-            # Check if the metric exists and is not null in notcatapulted data
-            has_valid_metric = any(
-                result.get(args.metric_key) is not None
-                for result in notcatapulted_results
-            )
-            if has_valid_metric:
-                has_comparison_data = True
-            else:
-                print(
-                    f"Warning: Metric '{args.metric_key}' is null in all notcatapulted results, skipping comparison plot"
-                )
-        else:
-            print(
-                "Warning: No results found in notcatapulted.json, skipping comparison plot"
-            )
-    else:
-        print(f"Warning: {notcatapulted_path} does not exist, skipping comparison plot")
-
-    print(f"Processing metric: {args.metric_key}")
-    print(f"Catapulted results: {len(catapulted_results)}")
-    if has_comparison_data:
-        print(f"NotCatapulted results: {len(notcatapulted_results)}")
-
-    # Extract metric data
-    catapulted_data = extract_data(catapulted_results, args.metric_key)
-
-    # Average across seeds
-    print("Averaging across seeds...")
-    catapulted_avg = average_across_seeds(catapulted_data)
-
-    # Calculate improvement only if we have comparison data
-    improvement_matrix = None
-    if has_comparison_data:
-        notcatapulted_data = extract_data(notcatapulted_results, args.metric_key)
-        notcatapulted_avg = average_across_seeds(notcatapulted_data)
-
-        print("Calculating improvement percentages...")
-        improvement = calculate_improvement_pct(
-            catapulted_avg, notcatapulted_avg, args.metric_key
-        )
-        improvement_matrix, _, _ = create_heatmap_matrix(improvement)
-
-    # Create matrices for heatmaps
-    print("Creating heatmap matrices...")
-    catapulted_matrix, num_threads_labels, beam_width_labels = create_heatmap_matrix(
-        catapulted_avg
-    )
-
-    # Plot heatmaps
-    print("Generating plots...")
-    plot_heatmaps(
-        catapulted_matrix,
-        improvement_matrix,
-        num_threads_labels,
-        beam_width_labels,
-        args.metric_key,
-        output_path,
+    options = dict(
+        catapulted_path=catapulted_path,
+        notcatapulted_path=notcatapulted_path,
+        output_path=output_path,
+        dpi=args.dpi,
     )
-
-    print("Done!")
+    if len(args.metric_keys) == 1:
+        plot_metric(args.metric_keys[0], **options)
+    else:
+        # Plot each metric in its own process; loading, rendering and image
+        # encoding are independent per metric
+        plot = partial(plot_metric_buffered, **options)
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            list(pool.map(plot, args.metric_keys))
 
 
 if __name__ == "__main__":
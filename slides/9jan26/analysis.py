@@ -4,78 +4,420 @@ Performance Analysis: Catapult vs No-Catapult
 Parses benchmark logs and generates heatmap visualizations as png files.
 """
 
+import mmap
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+from types import FunctionType
 
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
 
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+
+# Patterns scanned in a single pass by Hyperscan, as (event id, expression).
+# Hyperscan does not report capture groups, so the numbers are sliced out of
+# the matched spans using the literal prefixes and suffixes below.
+# Events are sorted by (start, id): a block end sorts before the header that
+# starts at the same offset, so the header still opens a new block.
+_BLOCK_END, _CONFIG, _NODES, _QPS = range(4)
+_CONFIG_PREFIX, _CONFIG_SUFFIX = b"--- Configuration: threads=", b" ---"
+_CONFIG_SEPARATOR = b", beam_width="
+_NODES_PREFIX, _NODES_SUFFIX = b"Avg per search: ", b" nodes expanded"
+_QPS_PREFIX, _QPS_SUFFIX = b"(", b" QPS)"
+# Exact powers of ten, for decoding the decimals in matched spans
+_POW10 = np.array([float(10**k) for k in range(16)])
+_HS_PATTERNS = (
+    (_CONFIG, rb"--- Configuration: threads=\d+, beam_width=\d+ ---"),
+    (_NODES, rb"Avg per search: [\d.]+ nodes expanded"),
+    (_QPS, rb"\([\d.]+ QPS\)"),
+    # Like _BLOCK_END_RE, any header (even a malformed one) ends a block
+    (_BLOCK_END, rb"--- Configuration:"),
+    # Anchored to the start of the run of "=", so that a separator line is
+    # reported once rather than at every offset past its 20th "="
+    (_BLOCK_END, rb"(?:^|[^=])={20}"),
+)
+
+# Compiled patterns for the pure-Python fallback parser
+_CONFIG_RE = re.compile(rb"--- Configuration: threads=(\d+), beam_width=(\d+) ---")
+_BLOCK_END_RE = re.compile(rb"--- Configuration:|={20,}")
+_NODES_RE = re.compile(rb"Avg per search: ([\d.]+) nodes expanded")
+_QPS_RE = re.compile(rb"\(([\.\d]+) QPS\)")
+
+# Below this many Hyperscan matches, decoding them with int()/float() is
+# cheaper than importing numba and loading the compiled decoder
+_COMPILED_MIN_EVENTS = 4_000_000
+
+# Fixed png metadata, so regenerated plots only differ when their pixels do
+_PNG_METADATA = {"Software": "analysis.py"}
+
+
+@lru_cache(maxsize=None)
+def _hs_database():
+    """
+    Compile the log patterns into a Hyperscan block-mode database (once).
+    """
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    db.compile(
+        expressions=[expression for _, expression in _HS_PATTERNS],
+        ids=[pattern_id for pattern_id, _ in _HS_PATTERNS],
+        elements=len(_HS_PATTERNS),
+        flags=hyperscan.HS_FLAG_SOM_LEFTMOST | hyperscan.HS_FLAG_MULTILINE,
+    )
+    return db
 
-def parse_log_file(filepath):
+
+def _to_columns(threads, beam_widths, qps, nodes_expanded):
     """
-    Parse a benchmark log file and extract metrics.
+    Pack per-configuration values into the flat arrays returned by parse_log_file.
+    """
+    return {
+        "threads": np.asarray(threads, dtype=np.int64),
+        "beam_width": np.asarray(beam_widths, dtype=np.int64),
+        "qps": np.asarray(qps, dtype=np.float64),
+        "nodes_expanded": np.asarray(nodes_expanded, dtype=np.float64),
+    }
+
+
+# _parse_uint, _parse_decimal and _decode_events walk the log byte by byte;
+# they are only ever run compiled, see _compiled_decoder
+def _parse_uint(buf, pos):
+    """
+    Read the unsigned integer starting at buf[pos].
 
     Returns:
-        dict: Nested dictionary with structure {threads: {beam_width: {metric: value}}}
+        (value, position of the first non-digit byte)
     """
-    with open(filepath, "r") as f:
-        content = f.read()
+    value = 0
+    while pos < buf.shape[0] and 48 <= buf[pos] <= 57:
+        value = value * 10 + (int(buf[pos]) - 48)
+        pos += 1
+    return value, pos
+
+
+def _parse_decimal(buf, start, end):
+    """
+    Read the decimal number spanning buf[start:end] (digits and one '.').
+
+    Returns:
+        (value, ok); ok is False when the span cannot be decoded exactly here
+        (more than 15 digits, no digit, or several dots) and has to be handed
+        to float() instead
+    """
+    mantissa = 0
+    digits = 0
+    dots = 0
+    frac_digits = 0
+    for pos in range(start, end):
+        if buf[pos] == 46:  # '.'
+            dots += 1
+        else:
+            digits += 1
+            if digits > 15:
+                return np.nan, False
+            mantissa = mantissa * 10 + (int(buf[pos]) - 48)
+            if dots:
+                frac_digits += 1
+
+    if digits == 0 or dots > 1:
+        return np.nan, False
+    # Mantissas of at most 15 digits and powers of ten up to 1e15 are exact
+    # doubles, so the division is correctly rounded, just like float()
+    return float(mantissa) / _POW10[frac_digits], True
+
+
+def _decode_events(events, buf):
+    """
+    Turn sorted (start, pattern_id, end) match events into metric columns.
+
+    Args:
+        events: int64 array of shape (n, 3), sorted by start offset
+        buf: uint8 view of the scanned log
+
+    Returns:
+        (threads, beam_widths, qps, nodes_expanded, deferred) arrays, one
+        entry per configuration header; metrics missing from a block are NaN.
+        deferred holds a (pattern_id, configuration, start, end) row for each
+        number _parse_decimal could not decode, left NaN in its column
+    """
+    n_configs = 0
+    for i in range(events.shape[0]):
+        if events[i, 1] == _CONFIG:
+            n_configs += 1
+
+    threads = np.zeros(n_configs, dtype=np.int64)
+    beam_widths = np.zeros(n_configs, dtype=np.int64)
+    qps = np.full(n_configs, np.nan)
+    nodes_expanded = np.full(n_configs, np.nan)
+    # At most one qps and one nodes_expanded number is decoded per block
+    deferred = np.empty((2 * n_configs, 4), dtype=np.int64)
+    n_deferred = 0
+
+    current = -1
+    in_block = False
+    found_nodes = found_qps = False
+    for i in range(events.shape[0]):
+        start, pattern_id, end = events[i, 0], events[i, 1], events[i, 2]
+        ok = True
+        if pattern_id == _CONFIG:
+            current += 1
+            threads[current], pos = _parse_uint(buf, start + len(_CONFIG_PREFIX))
+            beam_widths[current], _ = _parse_uint(buf, pos + len(_CONFIG_SEPARATOR))
+            in_block = True
+            found_nodes = found_qps = False
+        elif not in_block:
+            continue
+        elif pattern_id == _BLOCK_END:
+            in_block = False
+        elif pattern_id == _NODES and not found_nodes:
+            found_nodes = True
+            start += len(_NODES_PREFIX)
+            end -= len(_NODES_SUFFIX)
+            nodes_expanded[current], ok = _parse_decimal(buf, start, end)
+        elif pattern_id == _QPS and not found_qps:
+            found_qps = True
+            start += len(_QPS_PREFIX)
+            end -= len(_QPS_SUFFIX)
+            qps[current], ok = _parse_decimal(buf, start, end)
+
+        if not ok:
+            deferred[n_deferred, 0] = pattern_id
+            deferred[n_deferred, 1] = current
+            deferred[n_deferred, 2] = start
+            deferred[n_deferred, 3] = end
+            n_deferred += 1
+
+    return threads, beam_widths, qps, nodes_expanded, deferred[:n_deferred]
+
+
+@lru_cache(maxsize=None)
+def _compiled_decoder():
+    """
+    Compile _decode_events and the helpers it calls with numba (once).
+
+    numba is imported here rather than at module load, so only logs large
+    enough to use the compiled decoder pay for it.
+
+    Returns:
+        The compiled _decode_events, or None when numba is not installed
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+
+    # The compiled functions resolve each other through this namespace, which
+    # leaves the module-level functions untouched
+    namespace = dict(globals())
+    for func in (_parse_uint, _parse_decimal, _decode_events):
+        namespace[func.__name__] = njit(cache=True)(
+            FunctionType(func.__code__, namespace, func.__name__)
+        )
+    return namespace["_decode_events"]
+
+
+def _decode_spans(events, content):
+    """
+    Decode sorted (start, pattern_id, end) match events with int()/float().
+
+    Follows the same block rules as _decode_events, for logs too small to
+    be worth compiling it.
+
+    Returns:
+        dict: Same structure as parse_log_file
+    """
+    threads, beam_widths, qps, nodes_expanded = [], [], [], []
+
+    in_block = False
+    for start, pattern_id, end in events:
+        if pattern_id == _CONFIG:
+            header = content[start + len(_CONFIG_PREFIX) : end - len(_CONFIG_SUFFIX)]
+            num_threads, beam_width = header.split(_CONFIG_SEPARATOR)
+            threads.append(int(num_threads))
+            beam_widths.append(int(beam_width))
+            qps.append(None)
+            nodes_expanded.append(None)
+            in_block = True
+        elif not in_block:
+            continue
+        elif pattern_id == _BLOCK_END:
+            in_block = False
+        elif pattern_id == _NODES and nodes_expanded[-1] is None:
+            nodes_expanded[-1] = float(
+                content[start + len(_NODES_PREFIX) : end - len(_NODES_SUFFIX)]
+            )
+        elif pattern_id == _QPS and qps[-1] is None:
+            qps[-1] = float(content[start + len(_QPS_PREFIX) : end - len(_QPS_SUFFIX)])
+
+    return _to_columns(threads, beam_widths, qps, nodes_expanded)
+
+
+def _parse_log_hyperscan(content):
+    """
+    Parse raw log bytes with a single linear Hyperscan pass.
+
+    Large logs are decoded by the numba-compiled _decode_events when numba is
+    installed; otherwise the matched spans are decoded with int()/float().
+
+    Returns:
+        dict: Same structure as parse_log_file
+    """
+    events = []
+
+    def on_match(pattern_id, start, end, flags, context):
+        events.append((start, pattern_id, end))
+
+    _hs_database().scan(content, match_event_handler=on_match)
+    events.sort()
+
+    decode = None
+    if len(events) >= _COMPILED_MIN_EVENTS:
+        decode = _compiled_decoder()
+    if decode is None:
+        return _decode_spans(events, content)
+
+    events = np.array(events, dtype=np.int64).reshape(-1, 3)
+    threads, beam_widths, qps, nodes_expanded, deferred = decode(
+        events, np.frombuffer(content, np.uint8)
+    )
+    # Numbers the compiled decoder cannot round exactly (or rejects) go
+    # through float(), which also raises on malformed ones like the regex
+    # parser does
+    columns = {_QPS: qps, _NODES: nodes_expanded}
+    for pattern_id, index, start, end in deferred.tolist():
+        columns[pattern_id][index] = float(content[start:end])
+
+    return _to_columns(threads, beam_widths, qps, nodes_expanded)
 
-    # Find all configuration blocks
-    config_pattern = r"--- Configuration: threads=(\d+), beam_width=(\d+) ---([\s\S]*?)(?=--- Configuration:|={20,}|$)"
-    configs = re.findall(config_pattern, content)
 
-    results = {}
+def _parse_log_regex(content):
+    """
+    Parse raw log bytes with Python regexes (fallback when Hyperscan is missing).
+
+    Returns:
+        dict: Same structure as parse_log_file
+    """
+    threads, beam_widths, qps, nodes_expanded = [], [], [], []
+
+    # Find all configuration blocks
+    for config in _CONFIG_RE.finditer(content):
+        threads.append(int(config.group(1)))
+        beam_widths.append(int(config.group(2)))
 
-    for threads_str, beam_width_str, block in configs:
-        threads = int(threads_str)
-        beam_width = int(beam_width_str)
+        # A block runs until the next configuration header or separator line;
+        # it is searched in place rather than sliced out of the content
+        block_start = config.end()
+        block_end = _BLOCK_END_RE.search(content, block_start)
+        block_end = block_end.start() if block_end else len(content)
 
         # Extract nodes expanded (avg per search)
-        nodes_match = re.search(r"Avg per search: ([\d.]+) nodes expanded", block)
-        nodes_expanded = float(nodes_match.group(1)) if nodes_match else None
+        nodes_match = _NODES_RE.search(content, block_start, block_end)
+        nodes_expanded.append(float(nodes_match.group(1)) if nodes_match else None)
 
         # Extract QPS
-        qps_match = re.search(r"\(([\.\d]+) QPS\)", block)
-        qps = float(qps_match.group(1)) if qps_match else None
+        qps_match = _QPS_RE.search(content, block_start, block_end)
+        qps.append(float(qps_match.group(1)) if qps_match else None)
+
+    return _to_columns(threads, beam_widths, qps, nodes_expanded)
+
+
+def parse_log_file(filepath):
+    """
+    Parse a benchmark log file and extract metrics.
 
-        # Store results
-        if threads not in results:
-            results[threads] = {}
+    The file is memory-mapped and scanned as bytes, so it is never copied
+    into a Python string. Uses Hyperscan when it is installed, decoding the
+    matches of large logs with a numba-compiled routine (if numba is
+    available), and falls back to Python regexes otherwise.
 
-        results[threads][beam_width] = {"nodes_expanded": nodes_expanded, "qps": qps}
+    Returns:
+        dict: One flat array per field, with an entry per configuration:
+            {"threads", "beam_width", "qps", "nodes_expanded"}. Metrics missing
+            from a configuration block are NaN.
+    """
+    parse = _parse_log_hyperscan if hyperscan is not None else _parse_log_regex
+
+    with open(filepath, "rb") as f:
+        # Empty files cannot be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return parse(b"")
 
-    return results
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            return parse(content)
 
 
-def results_to_matrix(results, metric):
+def results_to_matrices(results, metrics):
     """
-    Convert nested dict results to a 2D numpy array for heatmap plotting.
+    Convert parsed results to 2D numpy arrays for heatmap plotting.
+
+    The (threads, beam_width) axes are encoded once and shared by every
+    requested metric. Configurations that appear several times in a log are
+    averaged.
 
     Args:
-        results: Nested dict {threads: {beam_width: {metric: value}}}
-        metric: String name of the metric to extract ('qps' or 'nodes_expanded')
+        results: Flat arrays as returned by parse_log_file
+        metrics: Names of the metrics to extract ('qps' and/or 'nodes_expanded')
 
     Returns:
-        matrix: 2D numpy array
+        matrices: Dict mapping each metric to its 2D numpy array
         threads_list: List of thread values (y-axis)
         beam_widths_list: List of beam_width values (x-axis)
     """
-    threads_list = sorted(results.keys())
-    beam_widths_list = sorted(
-        set(bw for thread_data in results.values() for bw in thread_data.keys())
-    )
+    threads_list, ti = np.unique(results["threads"], return_inverse=True)
+    beam_widths_list, bj = np.unique(results["beam_width"], return_inverse=True)
+    shape = (len(threads_list), len(beam_widths_list))
+    group = ti * shape[1] + bj
+
+    matrices = {}
+    for metric in metrics:
+        values = results[metric]
+        valid = ~np.isnan(values)
+
+        # Average repeated configurations in one pass; missing configurations
+        # and missing metrics are left as 0
+        sums = np.bincount(
+            group[valid], weights=values[valid], minlength=shape[0] * shape[1]
+        )
+        counts = np.bincount(group[valid], minlength=shape[0] * shape[1])
+        matrices[metric] = (sums / np.maximum(counts, 1)).reshape(shape)
 
-    matrix = np.zeros((len(threads_list), len(beam_widths_list)))
+    return matrices, threads_list.tolist(), beam_widths_list.tolist()
 
-    for i, threads in enumerate(threads_list):
-        for j, beam_width in enumerate(beam_widths_list):
-            if beam_width in results[threads]:
-                value = results[threads][beam_width][metric]
-                matrix[i, j] = value if value is not None else 0
 
-    return matrix, threads_list, beam_widths_list
+@lru_cache(maxsize=None)
+def _get_plt():
+    """
+    Import pyplot and seaborn on first use.
+
+    Importing them pulls in font caching and backend discovery, which callers
+    that only parse logs should not pay for.
+    """
+    # Render off-screen; skips GUI backend discovery on headless machines
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Lay out figures with the constrained layout engine instead of
+    # per-figure tight_layout passes
+    plt.rcParams["figure.constrained_layout.use"] = True
+    return plt, sns
+
+
+def _ratio(numerator, denominator):
+    """
+    Elementwise numerator / denominator, NaN wherever the denominator is 0.
+    """
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.full_like(numerator, np.nan),
+        where=denominator != 0,
+    )
 
 
 def plot_heatmap(
@@ -88,46 +430,130 @@ def plot_heatmap(
     fmt=".0f",
     cbar_label="",
     custom_fmt=None,
+    ax=None,
+    dpi=150,
 ):
     """
     Plot a heatmap and save to png file.
+
+    When ax is given the heatmap is drawn into that axes of a shared figure
+    instead, and nothing is saved; the returned (ax, output_file) pair is
+    meant for save_heatmap_grid. The same pair is returned in both modes.
     """
-    plt.figure(figsize=(10, 6))
-
-    if custom_fmt:
-        # Create custom annotations
-        annot_data = np.empty_like(matrix, dtype=object)
-        for i in range(matrix.shape[0]):
-            for j in range(matrix.shape[1]):
-                annot_data[i, j] = custom_fmt.format(matrix[i, j])
-
-        ax = sns.heatmap(
-            matrix,
-            xticklabels=beam_widths_list,
-            yticklabels=threads_list,
-            annot=annot_data,
-            fmt="",
-            cmap=cmap,
-            cbar_kws={"label": cbar_label},
-        )
-    else:
-        ax = sns.heatmap(
-            matrix,
-            xticklabels=beam_widths_list,
-            yticklabels=threads_list,
-            annot=True,
-            fmt=fmt,
-            cmap=cmap,
-            cbar_kws={"label": cbar_label},
+    plt, sns = _get_plt()
+
+    standalone = ax is None
+    if standalone:
+        plt.figure(figsize=(10, 6))
+        ax = plt.gca()
+
+    # seaborn draws the whole figure to check for overlapping tick labels;
+    # hide the other panels of a shared figure meanwhile so that filling a
+    # grid stays linear in the number of heatmaps
+    hidden = [
+        other for other in ax.figure.axes if other is not ax and other.get_visible()
+    ]
+    for other in hidden:
+        other.set_visible(False)
+
+    try:
+        if custom_fmt:
+            # Create custom annotations (custom_fmt is a printf-style format)
+            annot_data = np.char.mod(custom_fmt, matrix)
+
+            sns.heatmap(
+                matrix,
+                xticklabels=beam_widths_list,
+                yticklabels=threads_list,
+                annot=annot_data,
+                fmt="",
+                cmap=cmap,
+                cbar_kws={"label": cbar_label},
+                ax=ax,
+            )
+        else:
+            sns.heatmap(
+                matrix,
+                xticklabels=beam_widths_list,
+                yticklabels=threads_list,
+                annot=True,
+                fmt=fmt,
+                cmap=cmap,
+                cbar_kws={"label": cbar_label},
+                ax=ax,
+            )
+
+        ax.set_xlabel("Beam Width", fontsize=12)
+        ax.set_ylabel("Threads", fontsize=12)
+        ax.set_title(title, fontsize=14, fontweight="bold")
+    finally:
+        for other in hidden:
+            other.set_visible(True)
+
+    if standalone:
+        plt.savefig(output_file, format="png", dpi=dpi, metadata=_PNG_METADATA)
+        plt.close()
+        print(f"Saved: {output_file}")
+
+    return ax, output_file
+
+
+def save_heatmap_grid(fig, panels, output_file, dpi=150, pad_inches=0.1, workers=4):
+    """
+    Render a figure of heatmaps once and save it along with one png per panel.
+
+    The figure is rasterized a single time; each panel file is cropped out of
+    that raster around the heatmap axes and its colorbar, so the individual
+    pngs cost no extra draw.
+
+    Args:
+        fig: Figure holding the heatmaps
+        panels: List of (ax, output_file) pairs as returned by plot_heatmap
+        output_file: Path for the whole figure
+        dpi: Resolution of the saved rasters
+        pad_inches: Padding kept around each cropped panel
+        workers: Number of images encoded in parallel
+    """
+    from matplotlib.transforms import Bbox
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+
+    # Build the heatmaps at screen resolution (seaborn redraws the figure
+    # for every heatmap) and only raise the dpi for the final render
+    fig.set_dpi(dpi)
+    fig.canvas.draw()
+    renderer = fig.canvas.get_renderer()
+    # The figure background is opaque, so the alpha channel is dropped
+    image = np.asarray(fig.canvas.buffer_rgba())[..., :3]
+    height, width = image.shape[:2]
+
+    pnginfo = PngInfo()
+    for key, value in _PNG_METADATA.items():
+        pnginfo.add_text(key, value)
+
+    # Crop every panel first, then encode all rasters concurrently: the
+    # zlib compression dominates and Pillow releases the GIL while encoding
+    rasters = [(image, output_file)]
+    for ax, panel_file in panels:
+        colorbar_ax = ax.collections[0].colorbar.ax
+        bbox = Bbox.union(
+            [ax.get_tightbbox(renderer), colorbar_ax.get_tightbbox(renderer)]
+        ).padded(pad_inches * dpi)
+
+        # Display coordinates have their origin at the bottom left
+        x0, x1 = max(int(bbox.x0), 0), min(int(np.ceil(bbox.x1)), width)
+        y0, y1 = max(height - int(np.ceil(bbox.y1)), 0), min(
+            height - int(bbox.y0), height
         )
+        rasters.append((image[y0:y1, x0:x1], panel_file))
+
+    def save(raster, raster_file):
+        Image.fromarray(raster).save(raster_file, dpi=(dpi, dpi), pnginfo=pnginfo)
 
-    plt.xlabel("Beam Width", fontsize=12)
-    plt.ylabel("Threads", fontsize=12)
-    plt.title(title, fontsize=14, fontweight="bold")
-    plt.tight_layout()
-    plt.savefig(output_file, format="png", dpi=300, bbox_inches="tight")
-    plt.close()
-    print(f"Saved: {output_file}")
+    images, files = zip(*rasters)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for raster_file, _ in zip(files, pool.map(save, images, files)):
+            print(f"Saved: {raster_file}")
 
 
 def main():
@@ -136,134 +562,170 @@ def main():
     cata_results = parse_log_file("log-cata.txt")
     nocata_results = parse_log_file("log-nocata.txt")
 
-    print(f"Catapult configs parsed: {sum(len(v) for v in cata_results.values())}")
-    print(f"No-Catapult configs parsed: {sum(len(v) for v in nocata_results.values())}")
+    print(f"Catapult configs parsed: {len(cata_results['threads'])}")
+    print(f"No-Catapult configs parsed: {len(nocata_results['threads'])}")
     print()
 
     # Convert to matrices
-    qps_matrix, threads, beam_widths = results_to_matrix(cata_results, "qps")
-    nodes_matrix, _, _ = results_to_matrix(cata_results, "nodes_expanded")
-    qps_matrix_nc, threads_nc, beam_widths_nc = results_to_matrix(nocata_results, "qps")
-    nodes_matrix_nc, _, _ = results_to_matrix(nocata_results, "nodes_expanded")
+    metrics = ("qps", "nodes_expanded")
+    cata_matrices, threads, beam_widths = results_to_matrices(cata_results, metrics)
+    nocata_matrices, threads_nc, beam_widths_nc = results_to_matrices(
+        nocata_results, metrics
+    )
+    qps_matrix, nodes_matrix = cata_matrices["qps"], cata_matrices["nodes_expanded"]
+    qps_matrix_nc = nocata_matrices["qps"]
+    nodes_matrix_nc = nocata_matrices["nodes_expanded"]
 
-    # Generate heatmaps
+    # Generate heatmaps, all drawn into one shared figure
     print("Generating heatmaps...")
-
-    plot_heatmap(
-        qps_matrix,
-        threads,
-        beam_widths,
-        "Catapult: QPS vs Threads and Beam Width",
-        "catapult_qps.png",
-        cmap="RdYlGn",
-        fmt=".0f",
-        cbar_label="Queries Per Second",
+    plt, _ = _get_plt()
+    fig, axes = plt.subplots(4, 2, figsize=(20, 24))
+    panels = []
+
+    panels.append(
+        plot_heatmap(
+            qps_matrix,
+            threads,
+            beam_widths,
+            "Catapult: QPS vs Threads and Beam Width",
+            "catapult_qps.png",
+            cmap="RdYlGn",
+            fmt=".0f",
+            cbar_label="Queries Per Second",
+            ax=axes[0, 0],
+        )
     )
 
-    plot_heatmap(
-        nodes_matrix,
-        threads,
-        beam_widths,
-        "Catapult: Nodes Expanded vs Threads and Beam Width",
-        "catapult_nodes.png",
-        cmap="YlOrRd",
-        fmt=".2f",
-        cbar_label="Avg Nodes Expanded",
+    panels.append(
+        plot_heatmap(
+            nodes_matrix,
+            threads,
+            beam_widths,
+            "Catapult: Nodes Expanded vs Threads and Beam Width",
+            "catapult_nodes.png",
+            cmap="YlOrRd",
+            fmt=".2f",
+            cbar_label="Avg Nodes Expanded",
+            ax=axes[0, 1],
+        )
     )
 
-    plot_heatmap(
-        qps_matrix_nc,
-        threads_nc,
-        beam_widths_nc,
-        "No-Catapult: QPS vs Threads and Beam Width",
-        "nocatapult_qps.png",
-        cmap="RdYlGn",
-        fmt=".0f",
-        cbar_label="Queries Per Second",
+    panels.append(
+        plot_heatmap(
+            qps_matrix_nc,
+            threads_nc,
+            beam_widths_nc,
+            "No-Catapult: QPS vs Threads and Beam Width",
+            "nocatapult_qps.png",
+            cmap="RdYlGn",
+            fmt=".0f",
+            cbar_label="Queries Per Second",
+            ax=axes[1, 0],
+        )
     )
 
-    plot_heatmap(
-        nodes_matrix_nc,
-        threads_nc,
-        beam_widths_nc,
-        "No-Catapult: Nodes Expanded vs Threads and Beam Width",
-        "nocatapult_nodes.png",
-        cmap="YlOrRd",
-        fmt=".2f",
-        cbar_label="Avg Nodes Expanded",
+    panels.append(
+        plot_heatmap(
+            nodes_matrix_nc,
+            threads_nc,
+            beam_widths_nc,
+            "No-Catapult: Nodes Expanded vs Threads and Beam Width",
+            "nocatapult_nodes.png",
+            cmap="YlOrRd",
+            fmt=".2f",
+            cbar_label="Avg Nodes Expanded",
+            ax=axes[1, 1],
+        )
     )
 
-    # Comparison plots
-    speedup_matrix = qps_matrix / qps_matrix_nc
-    plot_heatmap(
-        speedup_matrix,
-        threads,
-        beam_widths,
-        "QPS Speedup: Catapult vs No-Catapult",
-        "speedup_qps.png",
-        cmap="RdYlGn",
-        fmt=".2f",
-        cbar_label="Speedup Factor",
+    # Comparison plots; ratios are NaN where the No-Catapult value is 0
+    speedup_matrix = _ratio(qps_matrix, qps_matrix_nc)
+    panels.append(
+        plot_heatmap(
+            speedup_matrix,
+            threads,
+            beam_widths,
+            "QPS Speedup: Catapult vs No-Catapult",
+            "speedup_qps.png",
+            cmap="RdYlGn",
+            fmt=".2f",
+            cbar_label="Speedup Factor",
+            ax=axes[2, 0],
+        )
     )
 
-    nodes_reduction = nodes_matrix / nodes_matrix_nc
-    plot_heatmap(
-        nodes_reduction,
-        threads,
-        beam_widths,
-        "Nodes Expanded Ratio: Catapult / No-Catapult",
-        "nodes_reduction.png",
-        cmap="RdYlGn_r",
-        fmt=".2f",
-        cbar_label="Ratio (lower is better)",
+    nodes_reduction = _ratio(nodes_matrix, nodes_matrix_nc)
+    panels.append(
+        plot_heatmap(
+            nodes_reduction,
+            threads,
+            beam_widths,
+            "Nodes Expanded Ratio: Catapult / No-Catapult",
+            "nodes_reduction.png",
+            cmap="RdYlGn_r",
+            fmt=".2f",
+            cbar_label="Ratio (lower is better)",
+            ax=axes[2, 1],
+        )
     )
 
     # Relative improvement in QPS (percentage)
-    qps_improvement = ((qps_matrix - qps_matrix_nc) / qps_matrix_nc) * 100
-    plot_heatmap(
-        qps_improvement,
-        threads,
-        beam_widths,
-        "QPS Improvement: Catapult over No-Catapult (%)",
-        "qps_improvement.png",
-        cmap="Greens",
-        fmt=".1f",
-        cbar_label="Improvement (%)",
-        custom_fmt="+{:.1f}%",
+    qps_improvement = (speedup_matrix - 1) * 100
+    panels.append(
+        plot_heatmap(
+            qps_improvement,
+            threads,
+            beam_widths,
+            "QPS Improvement: Catapult over No-Catapult (%)",
+            "qps_improvement.png",
+            cmap="Greens",
+            fmt=".1f",
+            cbar_label="Improvement (%)",
+            custom_fmt="+%.1f%%",
+            ax=axes[3, 0],
+        )
     )
 
     # Relative improvement in nodes expanded (percentage - negative is better, so invert)
-    nodes_improvement = -((nodes_matrix - nodes_matrix_nc) / nodes_matrix_nc) * 100
-    plot_heatmap(
-        nodes_improvement,
-        threads,
-        beam_widths,
-        "Nodes Expanded Reduction: Catapult vs No-Catapult (%)",
-        "nodes_improvement.png",
-        cmap="Greens",
-        fmt=".1f",
-        cbar_label="Reduction (% - positive is better)",
-        custom_fmt="-{:.1f}%",
+    nodes_improvement = (1 - nodes_reduction) * 100
+    panels.append(
+        plot_heatmap(
+            nodes_improvement,
+            threads,
+            beam_widths,
+            "Nodes Expanded Reduction: Catapult vs No-Catapult (%)",
+            "nodes_improvement.png",
+            cmap="Greens",
+            fmt=".1f",
+            cbar_label="Reduction (% - positive is better)",
+            custom_fmt="-%.1f%%",
+            ax=axes[3, 1],
+        )
     )
 
+    save_heatmap_grid(fig, panels, "all_heatmaps.png")
+    plt.close(fig)
+
     # Print summary statistics
     print()
     print("=" * 60)
     print("SUMMARY STATISTICS")
     print("=" * 60)
     print(f"\nQPS Speedup (Catapult vs No-Catapult):")
-    print(f"  Average: {speedup_matrix.mean():.2f}x")
-    print(f"  Maximum: {speedup_matrix.max():.2f}x")
-    print(f"  Minimum: {speedup_matrix.min():.2f}x")
+    print(f"  Average: {np.nanmean(speedup_matrix):.2f}x")
+    print(f"  Maximum: {np.nanmax(speedup_matrix):.2f}x")
+    print(f"  Minimum: {np.nanmin(speedup_matrix):.2f}x")
 
     print(f"\nNodes Expanded Reduction:")
-    print(f"  Average ratio: {nodes_reduction.mean():.2f}")
-    print(f"  Best (lowest): {nodes_reduction.min():.2f}")
-    print(f"  Worst (highest): {nodes_reduction.max():.2f}")
+    print(f"  Average ratio: {np.nanmean(nodes_reduction):.2f}")
+    print(f"  Best (lowest): {np.nanmin(nodes_reduction):.2f}")
+    print(f"  Worst (highest): {np.nanmax(nodes_reduction):.2f}")
 
     # Find best configurations
     best_qps_idx = np.unravel_index(qps_matrix.argmax(), qps_matrix.shape)
-    best_speedup_idx = np.unravel_index(speedup_matrix.argmax(), speedup_matrix.shape)
+    best_speedup_idx = np.unravel_index(
+        np.nanargmax(speedup_matrix), speedup_matrix.shape
+    )
 
     print(f"\nBest Catapult QPS Configuration:")
     print(